@@ -1,4 +1,3 @@
-import json
 from fastapi import HTTPException
 from comps.cores.proto.api_protocol import (
     ChatCompletionRequest,
@@ -10,7 +9,10 @@ from comps.cores.proto.api_protocol import (
 from comps.cores.mega.constants import ServiceType, ServiceRoleType
 from comps import MicroService, ServiceOrchestrator
 import os
+import asyncio
+import contextlib
 import aiohttp
+import orjson
 from comps.cores.mega.utils import handle_message
 from comps.cores.proto.docarray import LLMParams
 
@@ -28,10 +30,26 @@ from fastapi.responses import StreamingResponse
 #from comps.cores.mega.constants import ServiceType, ServiceRoleType
 #import os
 
+try:
+    import uvloop
+    # MicroService creates its loop with asyncio.new_event_loop() instead of
+    # going through uvicorn's loop setup, so install the policy here
+    uvloop.install()
+except ImportError:
+    # No uvloop build on Windows; stay on the default asyncio loop
+    pass
+
 EMBEDDING_SERVICE_HOST_IP = os.getenv("EMBEDDING_SERVICE_HOST_IP", "0.0.0.0")
-EMBEDDING_SERVICE_PORT = os.getenv("EMBEDDING_SERVICE_PORT", 6000)
+EMBEDDING_SERVICE_PORT = int(os.getenv("EMBEDDING_SERVICE_PORT", 6000))
 LLM_SERVICE_HOST_IP = os.getenv("LLM_SERVICE_HOST_IP", "0.0.0.0")
-LLM_SERVICE_PORT = os.getenv("LLM_SERVICE_PORT", 9000)
+LLM_SERVICE_PORT = int(os.getenv("LLM_SERVICE_PORT", 9000))
+LLM_SERVICE_BASE_URL = f"http://{LLM_SERVICE_HOST_IP}:{LLM_SERVICE_PORT}"
+OLLAMA_TAGS_URL = f"{LLM_SERVICE_BASE_URL}/api/tags"
+OLLAMA_CHAT_URL = f"{LLM_SERVICE_BASE_URL}/api/chat"
+# Model to load on startup; unset skips the prewarm since clients choose the model per request
+LLM_MODEL_ID = os.getenv("LLM_MODEL_ID")
+OLLAMA_CONNECT_TIMEOUT = 3  # Seconds; fail fast when Ollama is unreachable
+OLLAMA_RETRY_BACKOFF_BASE = 2  # Seconds; retries wait 2s, 4s, 8s, ...
 
 class ExampleService:
     def __init__(self, host="0.0.0.0", port=8000):
@@ -39,23 +57,70 @@ class ExampleService:
         self.port = port
         self.endpoint = "/v1/example-service"
         self.megaservice = ServiceOrchestrator()
+        self.prewarm_task = None
         os.environ["LOGFLAG"] = "true"  # Enable detailed logging
-    async def check_ollama_connection(self):
-        """Check if we can connect to Ollama"""
+
+    async def check_ollama_connection(self, max_attempts=1, timeout=5):
+        """Check if we can connect to Ollama.
+
+        Connection errors, timeouts and non-200 responses all count as a
+        failed attempt and are retried with exponential backoff, up to
+        max_attempts in total.
+        """
+        # Use the list models endpoint as a health check
+        async with aiohttp.ClientSession() as session:
+            for attempt in range(max_attempts):
+                if attempt:
+                    await asyncio.sleep(OLLAMA_RETRY_BACKOFF_BASE ** attempt)
+                try:
+                    print(f"\nTesting Ollama connection to: {OLLAMA_TAGS_URL} (attempt {attempt + 1}/{max_attempts})")
+                    async with session.get(OLLAMA_TAGS_URL, timeout=aiohttp.ClientTimeout(total=timeout, sock_connect=OLLAMA_CONNECT_TIMEOUT)) as response:
+                        print(f"Ollama check status: {response.status}")
+                        if response.status == 200:
+                            models = orjson.loads(await response.read())
+                            print(f"Available models: {models}")
+                            return True
+                except Exception as e:
+                    print(f"Failed to connect to Ollama: {e}")
+        return False
+
+    async def prewarm_ollama(self):
+        """Open the Ollama connection and load the model before the first request"""
+        if not LLM_MODEL_ID:
+            print("LLM_MODEL_ID not set, skipping Ollama prewarm")
+            return
+        if not await self.check_ollama_connection(max_attempts=3):
+            return
+        payload = {
+            "model": LLM_MODEL_ID,
+            "messages": [{"role": "user", "content": "hi"}],
+            "stream": False,
+            "keep_alive": "30m",  # Long enough to cover the first requests, not forever
+            "options": {"num_predict": 1},
+        }
         try:
             async with aiohttp.ClientSession() as session:
-                # Use the list models endpoint as a health check
-                url = f"http://{LLM_SERVICE_HOST_IP}:{LLM_SERVICE_PORT}/api/tags"
-                print(f"\nTesting Ollama connection to: {url}")
-                async with session.get(url) as response:
-                    print(f"Ollama check status: {response.status}")
-                    if response.status == 200:
-                        models = await response.json()
-                        print(f"Available models: {models}")
-                    return response.status == 200
+                # Loading the model from disk can take a while
+                async with session.post(
+                    OLLAMA_CHAT_URL,
+                    data=orjson.dumps(payload),
+                    headers={"Content-Type": "application/json"},
+                    timeout=aiohttp.ClientTimeout(total=120, sock_connect=OLLAMA_CONNECT_TIMEOUT),
+                ) as response:
+                    print(f"Ollama prewarm status for {LLM_MODEL_ID}: {response.status}")
+                    if response.status != 200:
+                        # e.g. 404 when the model hasn't been pulled yet
+                        print(f"Ollama prewarm failed: {await response.text()}")
         except Exception as e:
-            print(f"Failed to connect to Ollama: {e}")
-            return False
+            print(f"Failed to prewarm Ollama: {e}")
+
+    async def cancel_prewarm(self):
+        # Stop a prewarm still retrying or waiting on the model load; its
+        # ClientSession is closed as the cancellation unwinds
+        if self.prewarm_task is not None and not self.prewarm_task.done():
+            self.prewarm_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.prewarm_task
 
     def add_remote_service(self):
         #embedding = MicroService(
@@ -79,7 +144,7 @@ class ExampleService:
         print(f"- Host: {LLM_SERVICE_HOST_IP}")
         print(f"- Port: {LLM_SERVICE_PORT}")
         print(f"- Endpoint: {llm.endpoint}")
-        print(f"- Full URL: http://{LLM_SERVICE_HOST_IP}:{LLM_SERVICE_PORT}{llm.endpoint}")     
+        print(f"- Full URL: {LLM_SERVICE_BASE_URL}{llm.endpoint}")     
         self.megaservice.add(llm)
         # Flow from embedding to llm
         #self.megaservice.flow_to(embedding, llm)
@@ -108,9 +173,19 @@ class ExampleService:
         
         self.service.add_route(self.endpoint, self.handle_request, methods=["POST"])
         print(f"Service configured with endpoint: {self.endpoint}")
-        self.service.start()
+        # MicroService already ran the app's startup hooks while it was built,
+        # so schedule the prewarm on its loop; it runs in the background once
+        # the server starts rather than holding up startup on Ollama
+        self.prewarm_task = self.service.event_loop.create_task(self.prewarm_ollama())
+        try:
+            self.service.start()
+        finally:
+            # start() only returns by raising, e.g. KeyboardInterrupt, which
+            # leaves the loop stopped but open
+            if not self.service.event_loop.is_closed():
+                self.service.event_loop.run_until_complete(self.cancel_prewarm())
     async def handle_request(self, request: Request):
-        data = await request.json()
+        data = orjson.loads(await request.body())
         print("\n\ndata:\n",data)
         stream_opt = data.get("stream", True)
         print("\n\nstream_pot:\n",data)
@@ -140,7 +215,7 @@ class ExampleService:
             "messages": chat_request.messages,
         }
         print("\n\n\n\nPAYLOAD:\n")
-        print(json.dumps(initial_inputs))
+        print(initial_inputs)
         print("\n\n\n\n")
         result_dict, runtime_graph = await self.megaservice.schedule(
             initial_inputs=initial_inputs,